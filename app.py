@@ -1,14 +1,18 @@
 import streamlit as st
 import os
-import yaml
+import json
 import sqlite3
 import uuid
+from types import SimpleNamespace
+import pandas as pd
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from agno.agent import Agent
 from agno.models.google import Gemini
 from agno.db.sqlite import SqliteDb
+from agno.run.agent import RunEvent
+from sqlalchemy import event
 from file_tools import (
     list_directory_contents,
     read_file_content,
@@ -23,6 +27,7 @@ from knowledge_tools import (
     search_knowledge_base,
     get_indexed_documents
 )
+from instructions_loader import load_instructions
 
 load_dotenv()
 
@@ -31,57 +36,34 @@ from observability import (
     setup_langfuse_observability, 
     is_observability_enabled, 
     calculate_cost,
-    set_session_attributes
+    trace_turn
 )
 
 LANGFUSE_ENABLED = setup_langfuse_observability()
+LANGFUSE_TAGS = ["file-assistant", "rag", "streamlit"]  # Attached to every traced turn
 
 # Configuration constants (SOLID: Open/Closed Principle)
 MAX_HISTORY_LENGTH = 10  # Compress history after this many messages
 COMPRESS_KEEP_RECENT = 4  # Keep this many recent messages uncompressed
+_SUMMARY_ROLES = ('user', 'assistant')  # Roles included when summarizing old turns
+CHAT_RENDER_WINDOW = 20  # Render only this many recent messages per rerun
+RESPONSE_CACHE_SIZE = 32  # Cached responses kept per session (oldest evicted first)
+MEMORY_PAGE_SIZE = 20  # Memories fetched per "Load more" click
+MEMORY_CACHE_TTL_SECONDS = 30  # How long a fetched memory page is served from cache
 
-# Load instructions function
-def load_instructions(yaml_path: str = "instructions.yaml") -> list:
-    try:
-        with open(yaml_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        
-        instructions = []
-        
-        if 'system' in config and 'role' in config['system']:
-            instructions.append(config['system']['role'])
-        
-        if 'core_principles' in config:
-            instructions.extend(config['core_principles'])
-        
-        for category, items in config.get('behavioral_guidelines', {}).items():
-            if isinstance(items, list):
-                instructions.extend(items)
-            elif isinstance(items, dict):
-                for subcategory, subitems in items.items():
-                    if isinstance(subitems, list):
-                        instructions.extend(subitems)
-        
-        for category, items in config.get('advanced_capabilities', {}).items():
-            if isinstance(items, list):
-                instructions.extend(items)
-        
-        if 'error_handling' in config:
-            instructions.extend(config['error_handling'])
-        
-        if 'prohibited_behaviors' in config:
-            instructions.extend(config['prohibited_behaviors'])
-        
-        if 'quality_standards' in config:
-            instructions.extend(config['quality_standards'])
-        
-        return instructions
-    
-    except Exception as e:
-        return [
-            "You are a helpful local file assistant.",
-            "Be proactive and use the available tools to help users with their files."
-        ]
+# Memory Viewer queries (only the columns we actually render)
+MEMORY_INDEX_DDL = """
+    CREATE INDEX IF NOT EXISTS idx_agno_memories_user_created
+    ON agno_memories(user_id, created_at DESC)
+"""
+MEMORY_COLUMNS = ('memory_id', 'memory', 'topics', 'created_at', 'updated_at')
+MEMORY_PAGE_QUERY = f"""
+    SELECT {', '.join(MEMORY_COLUMNS)}
+    FROM agno_memories
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT ? OFFSET ?
+"""
 
 # Session management functions (SOLID: Single Responsibility Principle)
 def compress_chat_history(agent: Agent, chat_history: list, max_length: int, keep_recent: int) -> list:
@@ -101,15 +83,18 @@ def compress_chat_history(agent: Agent, chat_history: list, max_length: int, kee
         return chat_history
     
     # Separate old and recent messages
-    old_messages = chat_history[:len(chat_history) - keep_recent]
-    recent_messages = chat_history[len(chat_history) - keep_recent:]
-    
-    # Build conversation text from old messages
-    conversation_text = "\n".join([
-        f"{msg['role']}: {msg['content'][:200]}..." if len(msg['content']) > 200 else f"{msg['role']}: {msg['content']}"
-        for msg in old_messages
-        if msg['role'] in ['user', 'assistant']
-    ])
+    split = len(chat_history) - keep_recent
+    old_messages = chat_history[:split]
+    recent_messages = chat_history[split:]
+    
+    # Build conversation text from old messages (one length check and one slice per message)
+    parts = []
+    for msg in old_messages:
+        if msg['role'] not in _SUMMARY_ROLES:
+            continue
+        content = msg['content']
+        parts.append(f"{msg['role']}: {content[:200]}{'...' if len(content) > 200 else ''}")
+    conversation_text = "\n".join(parts)
     
     # Generate summary
     try:
@@ -129,6 +114,172 @@ def compress_chat_history(agent: Agent, chat_history: list, max_length: int, kee
         # If summarization fails, just return original history
         return chat_history
 
+@st.cache_data(ttl=MEMORY_CACHE_TTL_SECONDS, show_spinner=False)
+def fetch_memories(user_id: str, offset: int = 0) -> list[dict]:
+    """Fetch one page of memories as plain dicts so Streamlit can cache them."""
+    try_create_memory_index()  # No-op once the index exists
+    rows = get_memory_conn().execute(
+        MEMORY_PAGE_QUERY,
+        (user_id, MEMORY_PAGE_SIZE, offset)
+    ).fetchmany(MEMORY_PAGE_SIZE)
+    return [dict(zip(MEMORY_COLUMNS, row)) for row in rows]
+
+def load_memory_page(user_id: str) -> None:
+    """Append the next page of memories for user_id to the Memory Viewer state."""
+    rows = fetch_memories(user_id, len(st.session_state.memories))
+    st.session_state.memories.extend(rows)
+    st.session_state.memories_exhausted = len(rows) < MEMORY_PAGE_SIZE
+
+def render_chat_message(msg: dict) -> None:
+    """Render a single chat history entry."""
+    if msg['role'] == 'user':
+        with st.chat_message("user"):
+            st.markdown(msg['content'])
+    
+    elif msg['role'] == 'assistant':
+        with st.chat_message("assistant"):
+            # Display tool calls first (if any)
+            if 'tool_calls' in msg and msg['tool_calls']:
+                for tool_exec in msg['tool_calls']:
+                    # Special display for reasoning tool
+                    if 'think' in tool_exec.tool_name.lower() or 'reason' in tool_exec.tool_name.lower():
+                        with st.expander("🧠 Agent Reasoning", expanded=False):
+                            st.markdown("**Thought Process:**")
+                            st.info(tool_exec.result)
+                            if tool_exec.tool_args:
+                                st.caption("Reasoning parameters:")
+                                st.code(json.dumps(tool_exec.tool_args, indent=2, default=str), language="json")
+                    else:
+                        # Regular tool display (st.code is cheaper than st.json's interactive widget)
+                        with st.expander(f"🔧 Tool: **{tool_exec.tool_name}**", expanded=False):
+                            st.write("**Arguments:**")
+                            st.code(json.dumps(tool_exec.tool_args, indent=2, default=str), language="json")
+                            st.write("**Result:**")
+                            st.code(tool_exec.result, language="text")
+            
+            # Display final response
+            st.markdown(msg['content'])
+    
+    elif msg['role'] == 'summary':
+        # Display compressed conversation summary with special styling
+        with st.chat_message("assistant", avatar="📋"):
+            st.info(f"**Earlier Conversation Summary:**\n\n{msg['content']}")
+            st.caption("_Older messages were compressed to maintain context efficiency_")
+
+def stream_agent_response(agent: Agent, user_input: str) -> SimpleNamespace:
+    """
+    Run the agent in streaming mode, painting tokens into the chat as they arrive.
+    
+    Args:
+        agent: Agent instance to run
+        user_input: The user's message
+    
+    Returns:
+        Object with content, tools and metrics, shaped like a non-streamed run response
+    """
+    content, tools, metrics = "", [], None
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.markdown("_Thinking..._")
+        for run_event in agent.run(user_input, stream=True, stream_intermediate_steps=True):
+            if run_event.event == RunEvent.run_content and isinstance(run_event.content, str):
+                content += run_event.content
+                placeholder.markdown(content + "▌")
+            elif run_event.event == RunEvent.tool_call_completed and run_event.tool is not None:
+                tools.append(run_event.tool)
+            elif run_event.event == RunEvent.run_completed:
+                metrics = run_event.metrics
+        placeholder.markdown(content)
+    return SimpleNamespace(content=content, tools=tools, metrics=metrics)
+
+# Agent dependencies shared by every agent instance
+@st.cache_resource
+def get_db() -> SqliteDb:
+    """Open the agent's SQLite store once, switch it to WAL and index memory lookups by user."""
+    db = SqliteDb(db_file="assistant.db")
+    engine = getattr(db, "db_engine", None)
+    if engine is not None:
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_conn, _record):
+            # synchronous is per-connection; NORMAL is durable enough under WAL
+            dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+    conn = sqlite3.connect('assistant.db')
+    try:
+        # WAL is persisted in the file: readers no longer block the agent's writes
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+    try_create_memory_index()
+    return db
+
+@st.cache_resource
+def ensure_memory_index() -> bool:
+    """Create the memory lookup index; raises (and so isn't cached) until agno_memories exists."""
+    conn = sqlite3.connect('assistant.db')
+    try:
+        conn.execute(MEMORY_INDEX_DDL)
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+def try_create_memory_index() -> None:
+    """Create the memory index if possible; agno creates agno_memories lazily on the first memory write."""
+    try:
+        ensure_memory_index()
+    except sqlite3.OperationalError:
+        pass  # Retried on the next call until the table exists
+
+@st.cache_resource
+def get_tools() -> list:
+    """Build the tool list once per process; ReasoningTools is a toolkit instance."""
+    return [
+        list_directory_contents,
+        read_file_content,
+        search_files_by_name,
+        search_in_files,
+        get_file_info,
+        read_document_content,
+        ReasoningTools(),  # Enable explicit chain-of-thought reasoning
+        index_document,  # RAG: Index documents into knowledge base
+        search_knowledge_base,  # RAG: Search indexed documents
+        get_indexed_documents  # RAG: View what's indexed
+    ]
+
+AGENT_DESCRIPTION = "An intelligent local file system assistant with comprehensive directory access, contextual memory, and proactive analysis capabilities."
+INSTRUCTIONS_PATH = "instructions.yaml"  # load_instructions caches per (path, mtime, size)
+
+def get_agent(user_id: str) -> Agent:
+    """
+    Build an agent for one browser session.
+    
+    Agents hold per-run state, so each session keeps its own in st.session_state;
+    the heavy parts (db, tools, instructions) are shared cached resources.
+    """
+    return Agent(
+        name="LocalFileAssistant",
+        model=Gemini(id="gemini-2.5-flash"),
+        db=get_db(),
+        enable_user_memories=True,
+        user_id=user_id,
+        tools=get_tools(),
+        description=AGENT_DESCRIPTION,
+        instructions=load_instructions(INSTRUCTIONS_PATH),
+        markdown=True
+    )
+
+@st.cache_resource
+def get_memory_conn() -> sqlite3.Connection:
+    """Open a read-only view of the memory database once and reuse it across reruns."""
+    get_db()  # Make sure the file exists and is in WAL mode before opening it read-only
+    conn = sqlite3.connect('file:assistant.db?mode=ro', uri=True, check_same_thread=False)
+    # No row_factory: rows stay plain tuples that map onto MEMORY_COLUMNS by position
+    conn.set_trace_callback(None)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    conn.execute("PRAGMA mmap_size=30000000000")
+    return conn
+
 # Page config
 st.set_page_config(
     page_title="Local File Assistant",
@@ -143,20 +294,23 @@ if 'chat_history' not in st.session_state:
 if 'user_id' not in st.session_state:
     st.session_state.user_id = "user_fenil"
 
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = CHAT_RENDER_WINDOW
+
+if 'response_cache' not in st.session_state:
+    st.session_state.response_cache = {}  # (user_id, normalized prompt) -> agent response
+    st.session_state.use_response_cache = False
+
+if 'memories' not in st.session_state:
+    st.session_state.memories = None  # None while the Memory Viewer is closed
+    st.session_state.memories_exhausted = False
+
 # Generate session_id for Langfuse trace grouping
 if 'session_id' not in st.session_state:
     # Create unique session ID: timestamp + random UUID
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     st.session_state.session_id = f"session_{timestamp}_{uuid.uuid4().hex[:8]}"
     
-    # Set OTEL resource attributes for session/user tracking in Langfuse
-    if LANGFUSE_ENABLED:
-        set_session_attributes(
-            session_id=st.session_state.session_id,
-            user_id=st.session_state.user_id,
-            tags=["file-assistant", "rag", "streamlit"]
-        )
-
 # Initialize session stats for cost tracking
 if 'total_tokens' not in st.session_state:
     st.session_state.total_tokens = 0
@@ -168,29 +322,7 @@ if 'total_requests' not in st.session_state:
     st.session_state.total_requests = 0
 
 if 'agent' not in st.session_state:
-    db = SqliteDb(db_file="assistant.db")
-    st.session_state.agent = Agent(
-        name="LocalFileAssistant",
-        model=Gemini(id="gemini-2.5-flash"),
-        db=db,
-        enable_user_memories=True,
-        user_id=st.session_state.user_id,
-        tools=[
-            list_directory_contents,
-            read_file_content,
-            search_files_by_name,
-            search_in_files,
-            get_file_info,
-            read_document_content,
-            ReasoningTools(),  # Enable explicit chain-of-thought reasoning
-            index_document,  # RAG: Index documents into knowledge base
-            search_knowledge_base,  # RAG: Search indexed documents
-            get_indexed_documents  # RAG: View what's indexed
-        ],
-        description="An intelligent local file system assistant with comprehensive directory access, contextual memory, and proactive analysis capabilities.",
-        instructions=load_instructions(),
-        markdown=True
-    )
+    st.session_state.agent = get_agent(st.session_state.user_id)
 
 # Sidebar
 with st.sidebar:
@@ -199,37 +331,18 @@ with st.sidebar:
     # User ID selector
     new_user_id = st.text_input("User ID", value=st.session_state.user_id, key="user_id_input")
     
+    st.checkbox(
+        "Use response cache",
+        key="use_response_cache",
+        help="Reuse answers to repeated prompts in this session. Off by default because memory-enabled answers change over time."
+    )
+    
     if new_user_id != st.session_state.user_id:
         st.session_state.user_id = new_user_id
         
-        # Update OTEL attributes with new user_id
-        if LANGFUSE_ENABLED:
-            set_session_attributes(
-                session_id=st.session_state.session_id,
-                user_id=st.session_state.user_id,
-                tags=["file-assistant", "rag", "streamlit"]
-            )
-        
-        # Recreate agent with new user_id
-        db = SqliteDb(db_file="assistant.db")
-        st.session_state.agent = Agent(
-            name="LocalFileAssistant",
-            model=Gemini(id="gemini-2.5-flash"),
-            db=db,
-            enable_user_memories=True,
-            user_id=st.session_state.user_id,
-            tools=[
-                list_directory_contents,
-                read_file_content,
-                search_files_by_name,
-                search_in_files,
-                get_file_info,
-                read_document_content
-            ],
-            description="An intelligent local file system assistant with comprehensive directory access, contextual memory, and proactive analysis capabilities.",
-            instructions=load_instructions(),
-            markdown=True
-        )
+        # Cheap to rebuild: db, tools and instructions are shared cached resources
+        st.session_state.agent = get_agent(new_user_id)
+        st.session_state.memories = None
         st.rerun()
     
     st.divider()
@@ -247,15 +360,9 @@ with st.sidebar:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         st.session_state.session_id = f"session_{timestamp}_{uuid.uuid4().hex[:8]}"
         
-        # Update OTEL attributes for new session
-        if LANGFUSE_ENABLED:
-            set_session_attributes(
-                session_id=st.session_state.session_id,
-                user_id=st.session_state.user_id,
-                tags=["file-assistant", "rag", "streamlit"]
-            )
-        
         st.session_state.chat_history = []
+        st.session_state.history_window = CHAT_RENDER_WINDOW
+        st.session_state.response_cache = {}
         st.session_state.total_tokens = 0
         st.session_state.total_input_tokens = 0
         st.session_state.total_output_tokens = 0
@@ -319,41 +426,40 @@ with st.sidebar:
     st.subheader("💾 Memory Viewer")
     
     if st.button("View Memories", use_container_width=True):
+        st.session_state.memories = []
+        st.session_state.memories_exhausted = False
+    
+    if st.session_state.memories is not None:
         try:
-            conn = sqlite3.connect('assistant.db')
-            conn.row_factory = sqlite3.Row  # Enable column access by name
-            cursor = conn.cursor()
-            
-            # Query agno_memories table directly
+            # Query agno_memories table directly, one page at a time
             try:
-                cursor.execute("""
-                    SELECT * FROM agno_memories 
-                    WHERE user_id = ? 
-                    ORDER BY created_at DESC
-                """, (st.session_state.user_id,))
+                if not st.session_state.memories and not st.session_state.memories_exhausted:
+                    load_memory_page(st.session_state.user_id)
                 
-                memories = cursor.fetchall()
+                memories = st.session_state.memories
                 
                 if memories:
-                    st.success(f"Found **{len(memories)}** memories for user: **{st.session_state.user_id}**")
+                    st.success(f"Showing **{len(memories)}** memories for user: **{st.session_state.user_id}**")
+                    
+                    # One dataframe instead of an expander + widgets per memory
+                    memories_df = pd.DataFrame(memories, columns=MEMORY_COLUMNS)
+                    for key in ('created_at', 'updated_at'):
+                        if key in memories_df:
+                            memories_df[key] = pd.to_datetime(memories_df[key], unit='s', errors='coerce')
+                    st.dataframe(memories_df, use_container_width=True, hide_index=True)
                     
-                    for i, mem in enumerate(memories, 1):
-                        with st.expander(f"💭 Memory #{i}", expanded=i==1):
-                            # Display each field
-                            for key in mem.keys():
-                                if key == 'memory' or key == 'content':
-                                    st.markdown(f"**{key.title()}:**")
-                                    st.info(mem[key])
-                                elif key in ['created_at', 'updated_at']:
-                                    from datetime import datetime
-                                    try:
-                                        # Try to format timestamp
-                                        ts = datetime.fromtimestamp(mem[key])
-                                        st.caption(f"{key}: {ts.strftime('%Y-%m-%d %H:%M:%S')}")
-                                    except:
-                                        st.caption(f"{key}: {mem[key]}")
-                                else:
-                                    st.write(f"**{key}:** {mem[key]}")
+                    # Drill into a single memory's full text
+                    selected = st.selectbox(
+                        "Inspect memory",
+                        range(len(memories)),
+                        format_func=lambda i: f"💭 Memory #{i + 1}"
+                    )
+                    st.info(memories[selected]['memory'])
+                    
+                    if not st.session_state.memories_exhausted:
+                        if st.button("Load more", use_container_width=True):
+                            load_memory_page(st.session_state.user_id)
+                            st.rerun()
                 else:
                     st.warning(f"No memories found for user: **{st.session_state.user_id}**")
                     st.info("💡 Try chatting with the assistant and mentioning your preferences!\n\nExample: *'My name is Alex and I prefer concise answers'*")
@@ -362,63 +468,41 @@ with st.sidebar:
                 st.error(f"Could not query agno_memories table: {e}")
                 
                 # Fallback: show what tables exist
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = cursor.fetchall()
+                tables = get_memory_conn().execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall()
                 st.write("**Available tables:**")
                 for table in tables:
-                    st.code(table['name'])
-            
-            conn.close()
+                    st.code(table[0])
             
         except Exception as e:
             st.error(f"Database error: {e}")
     
     if st.button("Clear Chat History", use_container_width=True):
         st.session_state.chat_history = []
+        st.session_state.history_window = CHAT_RENDER_WINDOW
         st.rerun()
 
 # Main area
 st.title("🤖 Local File Assistant")
 st.caption(f"User: **{st.session_state.user_id}**")
 
+@st.fragment
+def render_chat_history() -> None:
+    """Render the recent chat window; widgets inside rerun only this fragment."""
+    # Only render the most recent window; older turns are revealed on demand
+    hidden_count = len(st.session_state.chat_history) - st.session_state.history_window
+    if hidden_count > 0:
+        if st.button(f"Show older ({hidden_count} hidden)"):
+            st.session_state.history_window += CHAT_RENDER_WINDOW
+            st.rerun(scope="fragment")
+    
+    for msg in st.session_state.chat_history[-st.session_state.history_window:]:
+        render_chat_message(msg)
+
 # Chat container
 chat_container = st.container()
 
 with chat_container:
-    for msg in st.session_state.chat_history:
-        if msg['role'] == 'user':
-            with st.chat_message("user"):
-                st.markdown(msg['content'])
-        
-        elif msg['role'] == 'assistant':
-            with st.chat_message("assistant"):
-                # Display tool calls first (if any)
-                if 'tool_calls' in msg and msg['tool_calls']:
-                    for tool_exec in msg['tool_calls']:
-                        # Special display for reasoning tool
-                        if 'think' in tool_exec.tool_name.lower() or 'reason' in tool_exec.tool_name.lower():
-                            with st.expander("🧠 Agent Reasoning", expanded=False):
-                                st.markdown("**Thought Process:**")
-                                st.info(tool_exec.result)
-                                if tool_exec.tool_args:
-                                    with st.expander("View reasoning parameters", expanded=False):
-                                        st.json(tool_exec.tool_args)
-                        else:
-                            # Regular tool display
-                            with st.expander(f"🔧 Tool: **{tool_exec.tool_name}**", expanded=False):
-                                st.write("**Arguments:**")
-                                st.json(tool_exec.tool_args)
-                                st.write("**Result:**")
-                                st.code(tool_exec.result, language="text")
-                
-                # Display final response
-                st.markdown(msg['content'])
-        
-        elif msg['role'] == 'summary':
-            # Display compressed conversation summary with special styling
-            with st.chat_message("assistant", avatar="📋"):
-                st.info(f"**Earlier Conversation Summary:**\n\n{msg['content']}")
-                st.caption("_Older messages were compressed to maintain context efficiency_")
+    render_chat_history()
 
 # Chat input
 user_input = st.chat_input("Ask me about your files...")
@@ -430,16 +514,31 @@ if user_input:
         'content': user_input
     })
     
-    # Get agent response (OTEL attributes already set, will auto-trace to Langfuse)
-    with st.spinner("Thinking..."):
-        response = st.session_state.agent.run(user_input)
-    
-    # Track metrics for accurate cost monitoring
-    if hasattr(response, 'metrics') and response.metrics:
-        st.session_state.total_tokens += response.metrics.total_tokens
-        st.session_state.total_input_tokens += response.metrics.input_tokens
-        st.session_state.total_output_tokens += response.metrics.output_tokens
-        st.session_state.total_requests += 1
+    # Reuse an earlier answer to the same prompt when the response cache is on
+    cache_key = (st.session_state.user_id, user_input.strip().lower())
+    response = None
+    if st.session_state.use_response_cache:
+        response = st.session_state.response_cache.get(cache_key)
+    
+    if response is None:
+        # Stream the agent response inside a session/user-tagged span (auto-traced to Langfuse)
+        render_chat_message(st.session_state.chat_history[-1])
+        with trace_turn(st.session_state.session_id, st.session_state.user_id, tags=LANGFUSE_TAGS):
+            response = stream_agent_response(st.session_state.agent, user_input)
+        fetch_memories.clear()  # The run may have stored new memories
+        
+        # Track metrics for accurate cost monitoring
+        if hasattr(response, 'metrics') and response.metrics:
+            st.session_state.total_tokens += response.metrics.total_tokens
+            st.session_state.total_input_tokens += response.metrics.input_tokens
+            st.session_state.total_output_tokens += response.metrics.output_tokens
+            st.session_state.total_requests += 1
+        
+        if st.session_state.use_response_cache:
+            response_cache = st.session_state.response_cache
+            response_cache[cache_key] = response
+            if len(response_cache) > RESPONSE_CACHE_SIZE:
+                del response_cache[next(iter(response_cache))]  # Evict the oldest entry
     
     # Add assistant response to history
     st.session_state.chat_history.append({
@@ -1,7 +1,33 @@
+import io
 import os
+import re
+import fnmatch
+import mmap
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 
+SEARCH_MAX_MATCHES = 50
+SEARCH_MAX_BYTES = 8 * 1024 * 1024  # Per-file read ceiling for search_in_files
+SEARCH_MMAP_THRESHOLD = 1024 * 1024  # Files larger than this are memory-mapped instead of read
+SEARCH_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # Threads overlapping file reads
+READ_MAX_CHARS = 256 * 1024  # Text returned by read_file_content, however long its lines are
+BINARY_PROBE_BYTES = 4096  # Leading bytes checked for NUL before scanning a file
+BINARY_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp',
+    '.pdf', '.zip', '.gz', '.tar', '.7z', '.rar',
+    '.exe', '.dll', '.so', '.dylib', '.bin', '.o', '.a',
+    '.pyc', '.class', '.jar', '.db', '.sqlite',
+    '.mp3', '.mp4', '.wav', '.mov', '.avi'
+}
+TREE_INDEX_TTL_SECONDS = 30  # Max age of a cached directory index for search_files_by_name
+TREE_INDEX_MAX_ROOTS = 4  # Distinct search roots whose index is kept
+
+# root -> (signature, index) for search_files_by_name
+_tree_indexes = {}
+
 def list_directory_contents(directory_path: str) -> str:
     try:
         path = Path(directory_path)
@@ -11,12 +37,16 @@ def list_directory_contents(directory_path: str) -> str:
         if not path.is_dir():
             return f"Error: {directory_path} is not a directory"
         
-        items = []
-        for item in sorted(path.iterdir()):
-            item_type = "DIR" if item.is_dir() else "FILE"
-            items.append(f"{item_type}: {item.name}")
+        # Written straight into one buffer (no per-line strings or intermediate list)
+        buf = io.StringIO()
+        buf.write(f"Contents of {directory_path}:")
+        with os.scandir(directory_path) as entries:
+            # DirEntry.is_dir() answers from the cached d_type (no extra stat except for symlinks)
+            for entry in sorted(entries, key=lambda e: e.name):
+                buf.write("\nDIR: " if entry.is_dir() else "\nFILE: ")
+                buf.write(entry.name)
         
-        return f"Contents of {directory_path}:\n" + "\n".join(items)
+        return buf.getvalue()
     except Exception as e:
         return f"Error listing directory: {str(e)}"
 
@@ -29,70 +59,221 @@ def read_file_content(file_path: str, max_lines: int = 100) -> str:
         if not path.is_file():
             return f"Error: {file_path} is not a file"
         
-        with open(path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            total_lines = len(lines)
+        with open(path, 'rb') as raw:
+            # Same NUL probe as _scan_file: refuse binary files instead of decoding them
+            if b'\0' in raw.read(BINARY_PROBE_BYTES):
+                return f"Error: Cannot read {file_path} - binary file or unsupported encoding"
+            raw.seek(0)
             
-            if total_lines > max_lines:
-                content = ''.join(lines[:max_lines])
-                return f"First {max_lines} lines of {file_path} (total {total_lines} lines):\n{content}\n... truncated ..."
-            else:
-                content = ''.join(lines)
-                return f"Content of {file_path} ({total_lines} lines):\n{content}"
-    except UnicodeDecodeError:
-        return f"Error: Cannot read {file_path} - binary file or unsupported encoding"
+            # Stream only what we return (plus one line to detect truncation), capped in characters
+            # as well as lines so one huge line can't be pulled into memory whole
+            f = io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+            lines = []
+            budget = READ_MAX_CHARS
+            while len(lines) <= max_lines and budget > 0:
+                line = f.readline(budget)
+                if not line:
+                    break
+                lines.append(line)
+                budget -= len(line)
+            hit_char_cap = budget <= 0 and len(lines) <= max_lines and f.read(1) != ''
+        
+        if len(lines) > max_lines:
+            content = ''.join(lines[:max_lines])
+            return f"First {max_lines} lines of {file_path} (file continues beyond this point):\n{content}\n... truncated ..."
+        elif hit_char_cap:
+            content = ''.join(lines)
+            return f"First {READ_MAX_CHARS} characters of {file_path} (file continues beyond this point):\n{content}\n... truncated ..."
+        else:
+            content = ''.join(lines)
+            return f"Content of {file_path} ({len(lines)} lines):\n{content}"
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
+def _tree_signature(root: str) -> int:
+    # Cheap change detector: root mtime plus the mtimes of its immediate subdirectories.
+    # Deeper changes don't touch these, so the TTL bucket bounds how stale an index can get.
+    with os.scandir(root) as entries:
+        subdir_mtimes = tuple(
+            entry.stat(follow_symlinks=False).st_mtime_ns
+            for entry in entries if entry.is_dir(follow_symlinks=False)
+        )
+    ttl_bucket = int(time.monotonic() // TREE_INDEX_TTL_SECONDS)
+    return hash((ttl_bucket, os.stat(root).st_mtime_ns) + subdir_mtimes)
+
+def _index_tree(root: str) -> tuple:
+    # Flat (relative_path, name) index of everything below root
+    index = []
+    pending = [(root, "")]
+    while pending:
+        current, prefix = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    rel_path = prefix + entry.name
+                    index.append((rel_path, entry.name))
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, rel_path + os.sep))
+        except OSError:
+            continue
+    return tuple(index)
+
+def _cached_tree_index(root: str) -> tuple:
+    # One (signature, index) entry per root, replaced when the signature changes
+    signature = _tree_signature(root)
+    cached = _tree_indexes.get(root)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    index = _index_tree(root)
+    _tree_indexes.pop(root, None)
+    _tree_indexes[root] = (signature, index)
+    while len(_tree_indexes) > TREE_INDEX_MAX_ROOTS:
+        del _tree_indexes[next(iter(_tree_indexes))]  # Drop the least recently built root
+    return index
+
 def search_files_by_name(directory_path: str, pattern: str) -> str:
     try:
         path = Path(directory_path)
         if not path.exists():
             return f"Error: Directory {directory_path} does not exist"
         
-        matches = list(path.rglob(f"*{pattern}*"))
+        # Same glob semantics as path.rglob(f"*{pattern}*"), filtered against a cached index
+        name_matches = re.compile(fnmatch.translate(f"*{pattern}*")).match
+        index = _cached_tree_index(directory_path)
+        matches = [rel_path for rel_path, name in index if name_matches(name)]
         
         if not matches:
             return f"No files matching '{pattern}' found in {directory_path}"
         
-        results = [str(match.relative_to(path)) for match in matches[:50]]
         count_msg = f"Found {len(matches)} matches" + (" (showing first 50)" if len(matches) > 50 else "")
         
-        return f"{count_msg} for '{pattern}' in {directory_path}:\n" + "\n".join(results)
+        buf = io.StringIO()
+        buf.write(f"{count_msg} for '{pattern}' in {directory_path}:")
+        for rel_path in matches[:50]:
+            buf.write("\n")
+            buf.write(rel_path)
+        return buf.getvalue()
     except Exception as e:
         return f"Error searching files: {str(e)}"
 
+def _iter_files(root: str, extension: str = ""):
+    # os.scandir hands back DirEntry objects with cached d_type, so no Path/stat per entry
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.name.endswith(extension) and entry.is_file():
+                        yield entry.path
+        except OSError:
+            continue
+
+def _find_lines(data, pattern: re.Pattern, limit: int) -> List[tuple]:
+    # Works on bytes, mmap and (for the non-ASCII fallback) decoded str; line numbers come from counting newlines between hits
+    newline = "\n" if isinstance(data, str) else b"\n"
+    hits = []
+    line_num = 1
+    counted_to = 0
+    pos = 0
+    while len(hits) < limit:
+        match = pattern.search(data, pos)
+        if match is None or match.start() >= len(data):
+            break
+        idx = match.start()
+        line_num += data[counted_to:idx].count(newline)
+        counted_to = idx
+        line_start = data.rfind(newline, 0, idx) + 1
+        line_end = data.find(newline, idx)
+        if line_end == -1:
+            line_end = len(data)
+        line = data[line_start:line_end]
+        if not isinstance(line, str):
+            line = line.decode('utf-8', errors='replace')
+        hits.append((line_num, line.strip()))
+        pos = line_end + 1  # one hit per line
+    return hits
+
+def _scan_file(file_path: str, pattern: re.Pattern, limit: int) -> List[tuple]:
+    with open(file_path, 'rb') as f:
+        # Text files don't contain NUL bytes; bail out before reading the rest of a binary file
+        head = f.read(BINARY_PROBE_BYTES)
+        if b"\x00" in head:
+            return []
+        
+        # Large files are mapped rather than copied onto the heap; either way only SEARCH_MAX_BYTES are scanned
+        size = os.fstat(f.fileno()).st_size
+        if size > SEARCH_MMAP_THRESHOLD and isinstance(pattern.pattern, bytes):
+            with mmap.mmap(f.fileno(), min(size, SEARCH_MAX_BYTES), access=mmap.ACCESS_READ) as data:
+                return _find_lines(data, pattern, limit)
+        
+        data = head + f.read(SEARCH_MAX_BYTES - len(head))
+    if isinstance(pattern.pattern, str):
+        # Non-ASCII needles need Unicode case folding, which only a str pattern does
+        data = data.decode('utf-8', errors='replace')
+    return _find_lines(data, pattern, limit)
+
+def _scan_or_skip(file_path: str, pattern: re.Pattern) -> List[tuple]:
+    try:
+        return _scan_file(file_path, pattern, SEARCH_MAX_MATCHES)
+    except OSError:
+        return []
+
+def _scan_files_parallel(file_paths, pattern: re.Pattern):
+    # Overlap file reads across threads but yield results in walk order.
+    # Only a bounded window is in flight, so nothing new is submitted once the caller stops.
+    executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS)
+    in_flight = deque()
+    try:
+        for file_path in file_paths:
+            in_flight.append((file_path, executor.submit(_scan_or_skip, file_path, pattern)))
+            if len(in_flight) >= SEARCH_MAX_WORKERS * 2:
+                done_path, future = in_flight.popleft()
+                yield done_path, future.result()
+        while in_flight:
+            done_path, future = in_flight.popleft()
+            yield done_path, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def search_in_files(directory_path: str, search_text: str, file_extension: str = "") -> str:
     try:
         path = Path(directory_path)
         if not path.exists():
             return f"Error: Directory {directory_path} does not exist"
         
-        pattern = f"*{file_extension}" if file_extension else "*"
-        files_to_search = [f for f in path.rglob(pattern) if f.is_file()]
-        
-        matches = []
-        for file_path in files_to_search:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line_num, line in enumerate(f, 1):
-                        if search_text.lower() in line.lower():
-                            rel_path = file_path.relative_to(path)
-                            matches.append(f"{rel_path}:{line_num}: {line.strip()}")
-                            if len(matches) >= 50:
-                                break
-            except (UnicodeDecodeError, PermissionError):
-                continue
+        # Compiled once; bytes + IGNORECASE does ASCII case folding without a lowercased copy of each file.
+        # That folding is ASCII-only, so non-ASCII needles match against decoded text instead.
+        if search_text.isascii():
+            pattern = re.compile(re.escape(search_text.encode('utf-8')), re.IGNORECASE)
+        else:
+            pattern = re.compile(re.escape(search_text), re.IGNORECASE)
+        
+        candidates = (
+            file_path for file_path in _iter_files(directory_path, file_extension)
+            if os.path.splitext(file_path)[1].lower() not in BINARY_EXTENSIONS
+        )
+        
+        # Matches are written straight into one buffer; the header is prepended once the count is known
+        buf = io.StringIO()
+        match_count = 0
+        for file_path, hits in _scan_files_parallel(candidates, pattern):
+            rel_path = os.path.relpath(file_path, directory_path)
+            for line_num, line in hits[:SEARCH_MAX_MATCHES - match_count]:
+                buf.write(f"\n{rel_path}:{line_num}: {line}")
+                match_count += 1
             
-            if len(matches) >= 50:
+            if match_count >= SEARCH_MAX_MATCHES:
                 break
         
-        if not matches:
+        if not match_count:
             ext_msg = f" in {file_extension} files" if file_extension else ""
             return f"No matches found for '{search_text}'{ext_msg} in {directory_path}"
         
-        count_msg = f"Found {len(matches)} matches"
-        return f"{count_msg} for '{search_text}':\n" + "\n".join(matches)
+        count_msg = f"Found {match_count} matches"
+        return f"{count_msg} for '{search_text}':{buf.getvalue()}"
     except Exception as e:
         return f"Error searching in files: {str(e)}"
 
@@ -119,9 +300,19 @@ def get_file_info(file_path: str) -> str:
     except Exception as e:
         return f"Error getting file info: {str(e)}"
 
+_markitdown = None
+
+def _get_markitdown():
+    # Built once on first use; raises ImportError if markitdown isn't installed
+    global _markitdown
+    if _markitdown is None:
+        from markitdown import MarkItDown
+        _markitdown = MarkItDown()
+    return _markitdown
+
 def read_document_content(file_path: str) -> str:
     try:
-        from markitdown import MarkItDown
+        md = _get_markitdown()
         
         path = Path(file_path)
         if not path.exists():
@@ -140,7 +331,6 @@ def read_document_content(file_path: str) -> str:
         if path.suffix.lower() not in supported_extensions:
             return f"Warning: {file_path} may not be supported. Attempting conversion anyway.\nSupported formats: PDF, DOCX, PPTX, XLSX, XLS, images, HTML, CSV, JSON, XML, ZIP, audio, Outlook MSG"
         
-        md = MarkItDown()
         result = md.convert(str(path.absolute()))
         
         file_type = path.suffix.upper().replace('.', '')
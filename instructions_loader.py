@@ -0,0 +1,133 @@
+"""
+Instruction loading shared by the Streamlit app and the CLI assistant
+
+Flattens instructions.yaml into the list of instruction strings passed to the
+agent. Results are cached per (path, mtime) in-process, so every entry point
+shares one parse, and in a compiled JSON file next to the YAML, so cold starts
+skip YAML parsing until the file changes.
+"""
+
+import os
+import functools
+import json
+import yaml
+from itertools import chain
+from typing import Optional
+
+try:
+    from yaml import CSafeLoader as _YamlLoader  # LibYAML-backed, much faster
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Flattened instructions are cached next to the YAML (e.g. instructions.yaml.cache.json)
+COMPILED_SUFFIX = ".cache.json"
+# Bump whenever the flattening logic changes so stale compiled files are ignored
+COMPILED_FORMAT_VERSION = 2
+
+
+def _flat(section) -> list:
+    """section is already a list of instructions"""
+    return [section or []]
+
+
+def _nested(section) -> list:
+    """category -> list, or category -> subcategory -> list"""
+    lists = []
+    for items in (section or {}).values():
+        if isinstance(items, list):
+            lists.append(items)
+        elif isinstance(items, dict):
+            lists.extend(subitems for subitems in items.values() if isinstance(subitems, list))
+    return lists
+
+
+# Top-level sections flattened into the instruction list, in this order
+_SECTIONS = (
+    ('core_principles', _flat),
+    ('behavioral_guidelines', _nested),
+    ('advanced_capabilities', _nested),
+    ('error_handling', _flat),
+    ('prohibited_behaviors', _flat),
+    ('quality_standards', _flat)
+)
+
+DEFAULT_INSTRUCTIONS = (
+    "You are a helpful local file assistant.",
+    "Be proactive and use the available tools to help users with their files."
+)
+
+
+def _read_compiled(compiled_path: str, source_key: list) -> Optional[tuple]:
+    """Return the compiled instructions if they were built from this exact source file and format."""
+    try:
+        with open(compiled_path, 'rb') as f:
+            compiled = json.loads(f.read())
+        if compiled.get('source') == source_key:
+            return tuple(compiled['instructions'])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return None
+
+
+def _write_compiled(compiled_path: str, source_key: list, instructions: tuple) -> None:
+    """Persist the flattened instructions next to the YAML (best effort, atomic replace)."""
+    tmp_path = f"{compiled_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': source_key, 'instructions': list(instructions)}, f)
+        os.replace(tmp_path, compiled_path)
+    except OSError:
+        pass  # e.g. read-only checkout: just keep parsing the YAML
+
+
+@functools.lru_cache(maxsize=4)
+def _load_instructions_cached(yaml_path: str, mtime: float, size: int) -> tuple:
+    """Load the flattened instructions; cached in-process per (path, mtime, size) and on disk."""
+    compiled_path = yaml_path + COMPILED_SUFFIX
+    # mtime alone misses edits on coarse-mtime filesystems; the version catches logic changes
+    source_key = [COMPILED_FORMAT_VERSION, mtime, size]
+    instructions = _read_compiled(compiled_path, source_key)
+    if instructions is not None:
+        return instructions
+    
+    instructions = _parse_instructions(yaml_path)
+    _write_compiled(compiled_path, source_key, instructions)
+    return instructions
+
+
+def _parse_instructions(yaml_path: str) -> tuple:
+    """Parse and flatten the instructions YAML file."""
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        config = yaml.load(f, Loader=_YamlLoader)
+    
+    parts = []
+    
+    if 'system' in config and 'role' in config['system']:
+        parts.append([config['system']['role']])
+    
+    for key, flatten in _SECTIONS:
+        parts.extend(flatten(config.get(key)))
+    
+    return tuple(chain.from_iterable(parts))
+
+
+def load_instructions(yaml_path: str = "instructions.yaml") -> list:
+    """
+    Load agent instructions from a YAML file
+    
+    Args:
+        yaml_path: Path to the instructions file
+        
+    Returns:
+        Flat list of instruction strings (defaults if the file can't be read)
+    """
+    try:
+        stat = os.stat(yaml_path)
+        return list(_load_instructions_cached(yaml_path, stat.st_mtime, stat.st_size))
+    
+    except FileNotFoundError:
+        print(f"Warning: {yaml_path} not found. Using default instructions.")
+        return list(DEFAULT_INSTRUCTIONS)
+    except Exception as e:
+        print(f"Error loading instructions: {e}. Using default instructions.")
+        return list(DEFAULT_INSTRUCTIONS)
@@ -12,8 +12,15 @@ SOLID Principles Applied:
 - Dependency Inversion: Abstracts embedding and storage details
 """
 
+import math
 import os
+import threading
+from hashlib import blake2b
 import lancedb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Optional
 import google.generativeai as genai
@@ -24,10 +31,21 @@ load_dotenv()
 
 # Configuration (SOLID: Open/Closed Principle)
 KNOWLEDGE_DB_PATH = "knowledge_db"
+KNOWLEDGE_TABLE_NAME = "documents"
 EMBEDDING_MODEL = "gemini-embedding-001"  # Gemini embedding model
 EMBEDDING_DIMENSION = 768  # Recommended dimension from Google
 CHUNK_SIZE_CHARS = 2000  # ~500 tokens
 CHUNK_OVERLAP_CHARS = 200  # Overlap between chunks
+EMBEDDING_MAX_INPUT_BYTES = 8000  # Conservative cap under the model's 2048-token input limit
+EMBEDDING_BATCH_SIZE = 100  # Max texts per embed_content request
+EMBEDDING_MAX_CONCURRENCY = 8  # Parallel single-text requests when batching is unavailable
+HASH_LOOKUP_BATCH_SIZE = 500  # chunk_hash values per IN (...) lookup
+VECTOR_VALUE_TYPE = pa.float16()  # Stored vector precision (halves storage vs float32)
+VECTOR_METRIC = "cosine"  # Distance used by both the ANN index and searches
+ANN_INDEX_MIN_ROWS = 5000  # Below this a brute-force scan is fast enough
+ANN_MAX_PARTITIONS = 256  # IVF partitions (capped; ~sqrt(rows) below the cap)
+ANN_NUM_SUB_VECTORS = 16  # PQ sub-vectors (768 / 16 = 48 dims each)
+SEARCH_NPROBES = 20  # IVF partitions probed per query
 TASK_TYPE_DOCUMENT = "RETRIEVAL_DOCUMENT"
 TASK_TYPE_QUERY = "RETRIEVAL_QUERY"
 
@@ -58,29 +76,47 @@ class DocumentChunker:
         chunks = []
         start = 0
         chunk_idx = 0
+        text_len = len(text)
         
-        while start < len(text):
-            end = start + self.chunk_size
-            chunk_text = text[start:end]
+        while start < text_len:
+            end = min(start + self.chunk_size, text_len)
+            
+            # End on whitespace so words aren't split (keep the cut past the overlap to guarantee progress)
+            if end < text_len:
+                lo = start + self.overlap + 1
+                cut = max(text.rfind(' ', lo, end), text.rfind('\n', lo, end), text.rfind('\t', lo, end))
+                if cut != -1:
+                    end = cut
+            
+            chunk_text = text[start:end].strip()
             
             # Don't create tiny final chunks
-            if len(chunk_text.strip()) < 100:
+            if len(chunk_text) < 100:
                 break
             
             chunks.append({
-                'text': chunk_text.strip(),
+                'text': chunk_text,
                 'source': source,
                 'chunk_index': chunk_idx,
                 'char_start': start,
                 'char_end': end
             })
             
-            start += self.chunk_size - self.overlap
+            if end == text_len:
+                break
+            start = end - self.overlap
             chunk_idx += 1
         
         return chunks
 
 
+def _cap_embedding_input(text: str) -> str:
+    """Trim text to EMBEDDING_MAX_INPUT_BYTES of UTF-8 without splitting a character"""
+    if len(text) * 4 <= EMBEDDING_MAX_INPUT_BYTES:
+        return text  # Can't exceed the cap even if every character is 4 bytes
+    return text.encode('utf-8')[:EMBEDDING_MAX_INPUT_BYTES].decode('utf-8', errors='ignore')
+
+
 class EmbeddingGenerator:
     """
     Generates embeddings using Gemini (Single Responsibility Principle)
@@ -101,6 +137,9 @@ class EmbeddingGenerator:
         Returns:
             Embedding vector
         """
+        text = _cap_embedding_input(text)
+        if not text.strip():
+            raise ValueError("Cannot embed empty text")
         result = genai.embed_content(
             model=self.model,
             content=text,
@@ -110,12 +149,177 @@ class EmbeddingGenerator:
         return result['embedding']
     
     def generate_batch_embeddings(self, texts: List[str], task_type: str = TASK_TYPE_DOCUMENT) -> List[List[float]]:
-        """Generate embeddings for multiple texts efficiently"""
-        # Gemini supports batch embedding
+        """
+        Generate embeddings for multiple texts efficiently
+        
+        Gemini accepts a list of contents per request, so this issues one call
+        per EMBEDDING_BATCH_SIZE texts instead of one call per text.
+        
+        Args:
+            texts: Input texts
+            task_type: Either RETRIEVAL_DOCUMENT or RETRIEVAL_QUERY
+            
+        Returns:
+            Embedding vectors, in the same order as texts
+        """
+        texts = [_cap_embedding_input(text) for text in texts]
         embeddings = []
-        for text in texts:
-            embeddings.append(self.generate_embedding(text, task_type))
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+            try:
+                result = genai.embed_content(
+                    model=self.model,
+                    content=batch,
+                    task_type=task_type,
+                    output_dimensionality=self.dimension
+                )
+            except (TypeError, ValueError):
+                # SDK versions without list-valued content: fall back to concurrent single requests
+                embeddings.extend(self._generate_concurrent_embeddings(batch, task_type))
+                continue
+            embeddings.extend(result['embedding'])
         return embeddings
+    
+    def _generate_concurrent_embeddings(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Embed texts one request each, with at most EMBEDDING_MAX_CONCURRENCY in flight"""
+        with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY) as executor:
+            return list(executor.map(lambda text: self.generate_embedding(text, task_type), texts))
+
+
+# Shared instances; all are stateless, so one of each serves every tool call
+_CHUNKER = DocumentChunker()
+_EMBEDDER = EmbeddingGenerator()
+_MARKITDOWN = MarkItDown()
+
+
+# Cached LanceDB handles, opened lazily and shared by every tool call
+_db = None
+_table = None
+_table_lock = threading.RLock()
+_indexed_rows = None  # Row count when the ANN index was last (re)built
+
+
+def _get_db():
+    """Connect to the knowledge base once per process"""
+    global _db
+    with _table_lock:
+        if _db is None:
+            _db = lancedb.connect(KNOWLEDGE_DB_PATH)
+        return _db
+
+
+def _get_table():
+    """Return the cached documents table, or None if nothing has been indexed yet"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                try:
+                    _table = _get_db().open_table(KNOWLEDGE_TABLE_NAME)
+                except Exception:
+                    return None
+    return _table
+
+
+def _add_to_table(data):
+    """Append rows to the documents table, creating it on the first write"""
+    global _table
+    with _table_lock:
+        table = _get_table()
+        if table is None:
+            _table = _get_db().create_table(KNOWLEDGE_TABLE_NAME, data=data)
+            try:
+                _table.create_scalar_index("chunk_hash")
+            except Exception:
+                pass  # Lookups still work, just without the index
+        else:
+            table.add(data)
+        return _table
+
+
+def _vector_value_type(table) -> pa.DataType:
+    """Element type for new vectors: whatever an existing table uses, else VECTOR_VALUE_TYPE"""
+    if table is None:
+        return VECTOR_VALUE_TYPE
+    return table.schema.field('vector').type.value_type  # Tables from before fp16 stay float32
+
+
+def _build_arrow_table(chunks: List[Dict], embeddings: List[List[float]], hashes: Optional[List[str]],
+                       value_type: pa.DataType = VECTOR_VALUE_TYPE) -> pa.Table:
+    """Assemble rows column-wise so vectors go to LanceDB as one contiguous buffer"""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    # Unit-normalise before narrowing: cosine ranking is unchanged and fp16 keeps full relative precision
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    matrix = matrix.astype(value_type.to_pandas_dtype())
+    columns = {
+        'text': pa.array([chunk['text'] for chunk in chunks], type=pa.string()),
+        'vector': pa.FixedSizeListArray.from_arrays(pa.array(matrix.reshape(-1), type=value_type), matrix.shape[1]),
+        'source': pa.array([chunk['source'] for chunk in chunks], type=pa.string()),
+        'chunk_index': pa.array([chunk['chunk_index'] for chunk in chunks], type=pa.int64()),
+        'char_start': pa.array([chunk['char_start'] for chunk in chunks], type=pa.int64()),
+        'char_end': pa.array([chunk['char_end'] for chunk in chunks], type=pa.int64()),
+    }
+    if hashes is not None:
+        columns['chunk_hash'] = pa.array(hashes, type=pa.string())
+    return pa.table(columns)
+
+
+def _maybe_build_vector_index(table) -> None:
+    """Build the IVF_PQ index once the table is large enough, and rebuild it when the row count doubles"""
+    global _indexed_rows
+    rows = table.count_rows()
+    if rows < ANN_INDEX_MIN_ROWS:
+        return
+    
+    with _table_lock:
+        if _indexed_rows is None and any('vector' in getattr(index, 'columns', ()) for index in table.list_indices()):
+            _indexed_rows = rows  # Index from an earlier run; start counting from here
+        if _indexed_rows is not None and rows < 2 * _indexed_rows:
+            return
+        try:
+            table.create_index(
+                metric=VECTOR_METRIC,
+                num_partitions=min(ANN_MAX_PARTITIONS, int(math.sqrt(rows))),
+                num_sub_vectors=ANN_NUM_SUB_VECTORS,
+                vector_column_name="vector",
+                replace=True
+            )
+            _indexed_rows = rows
+        except Exception:
+            pass  # Searches fall back to a flat scan until the next attempt
+
+
+def _chunk_hash(text: str) -> str:
+    """Content hash used to recognise chunks that were already embedded"""
+    return blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _table_has_hashes(table) -> bool:
+    """Tables created before chunk_hash existed can't be deduplicated"""
+    return table is None or 'chunk_hash' in table.schema.names
+
+
+def _lookup_embeddings(hashes: List[str]) -> Dict[str, List[float]]:
+    """Return stored vectors for any of the given chunk hashes already in the table"""
+    table = _get_table()
+    if table is None or not _table_has_hashes(table):
+        return {}
+    
+    found = {}
+    unique = list(dict.fromkeys(hashes))
+    for start in range(0, len(unique), HASH_LOOKUP_BATCH_SIZE):
+        batch = unique[start:start + HASH_LOOKUP_BATCH_SIZE]
+        in_list = ", ".join(f"'{h}'" for h in batch)  # Hex digests, safe to inline
+        rows = (
+            table.search()
+            .where(f"chunk_hash IN ({in_list})")
+            .select(["chunk_hash", "vector"])
+            .limit(max(table.count_rows(), 1))
+            .to_arrow()
+        )
+        found.update(zip(rows["chunk_hash"].to_pylist(), rows["vector"].to_pylist()))
+    return found
 
 
 # Tool functions for AGNO agent
@@ -138,49 +342,43 @@ def index_document(file_path: str) -> str:
             return f"Error: File {file_path} does not exist"
         
         # Extract text using markitdown
-        md = MarkItDown()
-        result = md.convert(str(path.absolute()))
+        result = _MARKITDOWN.convert(str(path.absolute()))
         text_content = result.text_content
         
         if not text_content or len(text_content.strip()) < 50:
             return f"Error: Could not extract meaningful text from {file_path}"
         
         # Chunk the document
-        chunker = DocumentChunker()
-        chunks = chunker.chunk_text(text_content, str(path.absolute()))
+        chunks = _CHUNKER.chunk_text(text_content, str(path.absolute()))
         
         if not chunks:
             return f"Error: No chunks created from {file_path}"
         
-        # Generate embeddings
-        embedder = EmbeddingGenerator()
+        # Generate embeddings, reusing vectors for chunks that are already stored
         chunk_texts = [chunk['text'] for chunk in chunks]
-        embeddings = embedder.generate_batch_embeddings(chunk_texts, TASK_TYPE_DOCUMENT)
+        chunk_hashes = [_chunk_hash(text) for text in chunk_texts]
+        vectors = _lookup_embeddings(chunk_hashes)
+        reused = sum(1 for h in chunk_hashes if h in vectors)
         
-        # Prepare data for LanceDB
-        data_for_db = []
-        for chunk, embedding in zip(chunks, embeddings):
-            data_for_db.append({
-                'text': chunk['text'],
-                'vector': embedding,
-                'source': chunk['source'],
-                'chunk_index': chunk['chunk_index'],
-                'char_start': chunk['char_start'],
-                'char_end': chunk['char_end']
-            })
+        to_embed = {}
+        for h, text in zip(chunk_hashes, chunk_texts):
+            if h not in vectors:
+                to_embed.setdefault(h, text)  # Duplicates within the document embed once
+        if to_embed:
+            new_embeddings = _EMBEDDER.generate_batch_embeddings(list(to_embed.values()), TASK_TYPE_DOCUMENT)
+            vectors.update(zip(to_embed.keys(), new_embeddings))
         
-        # Store in LanceDB
-        db = lancedb.connect(KNOWLEDGE_DB_PATH)
+        # Prepare data for LanceDB
+        embeddings = [vectors[h] for h in chunk_hashes]
+        table = _get_table()
+        hashes = chunk_hashes if _table_has_hashes(table) else None
+        data_for_db = _build_arrow_table(chunks, embeddings, hashes, _vector_value_type(table))
         
-        # Check if table exists, create or append
-        try:
-            table = db.open_table("documents")
-            table.add(data_for_db)
-        except Exception:
-            # Table doesn't exist, create it
-            table = db.create_table("documents", data=data_for_db)
+        # Store in LanceDB (table is created on first write)
+        table = _add_to_table(data_for_db)
+        _maybe_build_vector_index(table)
         
-        return f"Successfully indexed {path.name}: {len(chunks)} chunks created and embedded"
+        return f"Successfully indexed {path.name}: {len(chunks)} chunks created and embedded ({reused} reused from existing embeddings)"
         
     except Exception as e:
         return f"Error indexing document: {str(e)}"
@@ -207,18 +405,22 @@ def search_knowledge_base(query: str, num_results: int = 5) -> str:
             return "Knowledge base not found. Please index some documents first using the index_document tool."
         
         # Generate query embedding
-        embedder = EmbeddingGenerator()
-        query_embedding = embedder.generate_embedding(query, TASK_TYPE_QUERY)
+        query_embedding = _EMBEDDER.generate_embedding(query, TASK_TYPE_QUERY)
         
         # Search LanceDB
-        db = lancedb.connect(KNOWLEDGE_DB_PATH)
-        try:
-            table = db.open_table("documents")
-        except Exception:
+        table = _get_table()
+        if table is None:
             return "No documents have been indexed yet. Use index_document first."
         
         # Perform vector search
-        results = table.search(query_embedding).limit(num_results).to_list()
+        results = (
+            table.search(query_embedding)
+            .metric(VECTOR_METRIC)
+            .nprobes(SEARCH_NPROBES)
+            .select(["text", "source", "chunk_index"])  # Skip the vector payload
+            .limit(num_results)
+            .to_list()
+        )
         
         if not results:
             return f"No relevant information found for query: '{query}'"
@@ -254,23 +456,25 @@ def get_indexed_documents() -> str:
         if not db_path.exists():
             return "Knowledge base is empty (no documents indexed yet)"
         
-        db = lancedb.connect(KNOWLEDGE_DB_PATH)
         try:
-            table = db.open_table("documents")
+            table = _get_table()
+            if table is None:
+                return "Knowledge base is empty (no documents indexed yet)"
             
-            # Get all unique sources
-            all_data = table.to_pandas()
-            sources = all_data['source'].unique()
-            total_chunks = len(all_data)
+            # Project only the source column (no text/vector payload) and count per source in Arrow
+            total_chunks = table.count_rows()
+            source_column = table.search().select(["source"]).limit(max(total_chunks, 1)).to_arrow()["source"]
+            source_counts = pc.value_counts(source_column)  # first-seen order, like pandas unique()
+            sources = source_counts.field("values").to_pylist()
+            chunk_counts = source_counts.field("counts").to_pylist()
             
             output = [f"Knowledge Base Statistics:"]
             output.append(f"- Total chunks: {total_chunks}")
             output.append(f"- Indexed documents: {len(sources)}")
             output.append(f"\nDocuments:")
             
-            for source in sources:
-                doc_chunks = all_data[all_data['source'] == source]
-                output.append(f"  • {Path(source).name} ({len(doc_chunks)} chunks)")
+            for source, chunk_count in zip(sources, chunk_counts):
+                output.append(f"  • {Path(source).name} ({chunk_count} chunks)")
             
             return "\n".join(output)
             
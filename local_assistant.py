@@ -1,5 +1,4 @@
 import os
-import yaml
 from pathlib import Path
 from dotenv import load_dotenv
 from agno.agent import Agent
@@ -13,57 +12,11 @@ from file_tools import (
     get_file_info,
     read_document_content
 )
+from instructions_loader import load_instructions
 
 load_dotenv()
 
-def load_instructions(yaml_path: str = "instructions.yaml") -> list:
-    try:
-        with open(yaml_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        
-        instructions = []
-        
-        if 'system' in config and 'role' in config['system']:
-            instructions.append(config['system']['role'])
-        
-        if 'core_principles' in config:
-            instructions.extend(config['core_principles'])
-        
-        for category, items in config.get('behavioral_guidelines', {}).items():
-            if isinstance(items, list):
-                instructions.extend(items)
-            elif isinstance(items, dict):
-                for subcategory, subitems in items.items():
-                    if isinstance(subitems, list):
-                        instructions.extend(subitems)
-        
-        for category, items in config.get('advanced_capabilities', {}).items():
-            if isinstance(items, list):
-                instructions.extend(items)
-        
-        if 'error_handling' in config:
-            instructions.extend(config['error_handling'])
-        
-        if 'prohibited_behaviors' in config:
-            instructions.extend(config['prohibited_behaviors'])
-        
-        if 'quality_standards' in config:
-            instructions.extend(config['quality_standards'])
-        
-        return instructions
-    
-    except FileNotFoundError:
-        print(f"Warning: {yaml_path} not found. Using default instructions.")
-        return [
-            "You are a helpful local file assistant.",
-            "Be proactive and use the available tools to help users with their files."
-        ]
-    except Exception as e:
-        print(f"Error loading instructions: {e}. Using default instructions.")
-        return [
-            "You are a helpful local file assistant.",
-            "Be proactive and use the available tools to help users with their files."
-        ]
+_INSTRUCTIONS = load_instructions()
 
 db = SqliteDb(db_file="assistant.db")
 
@@ -82,7 +35,7 @@ agent = Agent(
         read_document_content
     ],
     description="An intelligent local file system assistant with comprehensive directory access, contextual memory, and proactive analysis capabilities.",
-    instructions=load_instructions(),
+    instructions=_INSTRUCTIONS,
     markdown=True
 )
 
@@ -2,105 +2,250 @@
 Observability module for AGNO Local Assistant
 
 Provides Langfuse integration via OpenTelemetry for session/user tracking.
+
+Settings (LANGFUSE_* and OTEL_*) are read from the environment when this
+module is imported. It does not load .env itself: the entry point should call
+load_dotenv() once before importing it (app.py does).
 """
 
 import os
 import base64
+import functools
+import logging
+from contextlib import contextmanager
 from typing import Optional, Dict, Any
-from dotenv import load_dotenv
 
-load_dotenv()
+try:
+    import openlit as _openlit  # Resolved once; setup reports if it's missing
+except ImportError:
+    _openlit = None
+
+logger = logging.getLogger("observability")
+
+# Span batching (tuned so bursts of agent tool calls queue up instead of being dropped)
+SPAN_MAX_QUEUE_SIZE = 4096
+SPAN_SCHEDULE_DELAY_MILLIS = 1000
+SPAN_MAX_EXPORT_BATCH_SIZE = 256
+SPAN_EXPORT_TIMEOUT_MILLIS = 10000
+
+# Langfuse credentials, resolved once at import (.env is loaded by the entry point)
+_PUB = os.environ.get('LANGFUSE_PUBLIC_KEY')
+_SEC = os.environ.get('LANGFUSE_SECRET_KEY')
+_HOST = os.environ.get('LANGFUSE_BASE_URL', 'https://cloud.langfuse.com')
+
+
+def _parse_sample_rate(raw: Optional[str]) -> float:
+    """LANGFUSE_SAMPLE_RATE as a fraction in [0, 1]; malformed values fall back to 1.0"""
+    if raw is None:
+        return 1.0
+    try:
+        rate = float(raw)
+        if rate != rate:
+            raise ValueError("NaN")
+        return min(max(rate, 0.0), 1.0)
+    except ValueError:
+        logger.warning("Invalid LANGFUSE_SAMPLE_RATE %r, sampling all traces", raw)
+        return 1.0
+
+
+# Fraction of traces kept (0.0-1.0) and span names never exported
+_SAMPLE_RATE = _parse_sample_rate(os.environ.get('LANGFUSE_SAMPLE_RATE'))
+_DROPPED_SPAN_NAMES = frozenset(
+    name.strip() for name in os.environ.get('OTEL_DROP_SPAN_NAMES', '').split(',') if name.strip()
+)
+# Basic Auth value for the OTEL endpoint (keys are ASCII)
+_AUTH_HEADER = base64.b64encode(f"{_PUB}:{_SEC}".encode("ascii")).decode("ascii") if _PUB and _SEC else None
+
+# Tags applied when the caller doesn't pass any
+_DEFAULT_TAGS = ("local-assistant", "streamlit", "agno")
+_DEFAULT_TAGS_STR = ",".join(_DEFAULT_TAGS)
+
+# Gemini 2.5 Flash pricing, per token
+_IN_RATE = 0.30 / 1_000_000
+_OUT_RATE = 2.50 / 1_000_000
 
 # Global state
-_observability_initialized = False
+enabled: bool = False  # True once setup succeeds; hot paths can read observability.enabled directly
+_langfuse_client = None
+_trace_fn = None  # _langfuse_client.trace, resolved once at setup
+
+
+class _SpanNameFilter:
+    """Span processor wrapper that discards spans with the given names before export"""
+    
+    def __init__(self, delegate, dropped_names: frozenset):
+        self._delegate = delegate
+        self._dropped_names = dropped_names
+    
+    def on_start(self, span, parent_context=None):
+        self._delegate.on_start(span, parent_context=parent_context)
+    
+    def on_end(self, span):
+        if span.name not in self._dropped_names:
+            self._delegate.on_end(span)
+    
+    def shutdown(self):
+        self._delegate.shutdown()
+    
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+    
+    def __getattr__(self, name):
+        # Forward any hooks newer SDK versions add to SpanProcessor
+        return getattr(self._delegate, name)
+
+
+def _bsp_default(env_var: str, default):
+    # None defers to BatchSpanProcessor, which reads, validates and falls back on the env var itself
+    return None if env_var in os.environ else default
+
+
+def _configure_batch_exporter(exporter):
+    """
+    Wrap an exporter in a BatchSpanProcessor so spans coalesce into few OTLP posts.
+    
+    The standard OTEL_BSP_* environment variables, when set, take precedence over the defaults above.
+    """
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    
+    return BatchSpanProcessor(
+        exporter,
+        max_queue_size=_bsp_default('OTEL_BSP_MAX_QUEUE_SIZE', SPAN_MAX_QUEUE_SIZE),
+        schedule_delay_millis=_bsp_default('OTEL_BSP_SCHEDULE_DELAY', SPAN_SCHEDULE_DELAY_MILLIS),
+        max_export_batch_size=_bsp_default('OTEL_BSP_MAX_EXPORT_BATCH_SIZE', SPAN_MAX_EXPORT_BATCH_SIZE),
+        export_timeout_millis=_bsp_default('OTEL_BSP_EXPORT_TIMEOUT', SPAN_EXPORT_TIMEOUT_MILLIS)
+    )
 
 
+def _build_tracer_provider():
+    """
+    Build an OTEL tracer provider with batched export and head-based sampling.
+    
+    LANGFUSE_SAMPLE_RATE (0.0-1.0, default 1.0) sets the fraction of traces kept;
+    child spans follow their parent's decision so traces are never partial.
+    OTEL_DROP_SPAN_NAMES is an optional comma-separated list of span names
+    (e.g. per-chunk streaming spans) that are never exported.
+    """
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    
+    provider = TracerProvider(
+        # Process-wide attributes only; per-session info goes on spans (see trace_turn)
+        resource=Resource.create({
+            "service.name": "local-assistant",
+            "deployment.environment.name": "development"
+        }),
+        sampler=ParentBased(TraceIdRatioBased(_SAMPLE_RATE))
+    )
+    
+    exporter = OTLPSpanExporter(
+        endpoint=f"{_HOST}/api/public/otel/v1/traces",
+        headers={"Authorization": f"Basic {_AUTH_HEADER}"}
+    )
+    processor = _configure_batch_exporter(exporter)
+    if _DROPPED_SPAN_NAMES:
+        processor = _SpanNameFilter(processor, _DROPPED_SPAN_NAMES)
+    provider.add_span_processor(processor)
+    return provider
+
+
+@functools.cache
 def setup_langfuse_observability() -> bool:
     """
     Setup Langfuse observability via OTEL with session/user tracking.
     
     Uses OpenLIT to send traces to Langfuse with proper resource attributes
-    for session_id and user_id tracking.
+    for session_id and user_id tracking. Runs once per process; later calls
+    (e.g. on every Streamlit rerun) return the cached result.
     
     Returns:
         bool: True if setup successful, False otherwise
     """
-    global _observability_initialized
-    
-    if _observability_initialized:
-        return True
+    global enabled, _trace_fn
     
     try:
-        # Get credentials
-        public_key = os.getenv('LANGFUSE_PUBLIC_KEY')
-        secret_key = os.getenv('LANGFUSE_SECRET_KEY')
-        host = os.getenv('LANGFUSE_BASE_URL', 'https://cloud.langfuse.com')
-        
-        if not public_key or not secret_key:
-            print("⚠️  Langfuse credentials not configured")
+        if _AUTH_HEADER is None:
+            logger.warning("Langfuse credentials not configured")
             return False
         
-        # Build Basic Auth header for OTEL endpoint
-        auth_header = base64.b64encode(
-            f"{public_key}:{secret_key}".encode()
-        ).decode()
+        if _openlit is None:
+            logger.warning("OpenLIT not available: install openlit to enable tracing")
+            return False
         
-        # Configure OTEL to send to Langfuse
-        os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = f"{host}/api/public/otel"
-        os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {auth_header}"
+        # Batched, sampled export straight to Langfuse; OpenLIT instruments through this tracer
+        from opentelemetry import trace
+        provider = _build_tracer_provider()
+        trace.set_tracer_provider(provider)
         
         # Initialize OpenLIT
-        import openlit
-        openlit.init(
+        _openlit.init(
             environment="development",
-            application_name="local-assistant"
+            application_name="local-assistant",
+            tracer=provider.get_tracer("local-assistant"),
+            disable_metrics=True  # Langfuse ingests traces only; no OTLP metrics endpoint configured
         )
         
-        _observability_initialized = True
+        _trace_fn = getattr(_langfuse_client, "trace", None)
+        enabled = True
         
-        print(f"✅ Langfuse observability enabled")
-        print(f"   Host: {host}")
-        print(f"   Method: OpenLIT + OTEL")
+        logger.info(
+            "Langfuse observability enabled (host: %s, method: OpenLIT + OTEL, batched, sample rate %s)",
+            _HOST, _SAMPLE_RATE
+        )
         
         return True
         
     except ImportError as e:
-        print(f"⚠️  OpenLIT not available: {e}")
+        logger.warning("OpenTelemetry SDK not available: %s", e)
         return False
     except Exception as e:
-        print(f"⚠️  Failed to setup observability: {e}")
+        logger.warning("Failed to setup observability: %s", e)
         return False
 
 
-def set_session_attributes(session_id: str, user_id: str, tags: Optional[list] = None):
+@contextmanager
+def trace_turn(session_id: str, user_id: str, tags: Optional[list] = None):
     """
-    Update OTEL resource attributes with session and user info.
+    Wrap one agent turn in a span carrying session and user info.
     
-    This makes session_id and user_id show up in Langfuse traces.
-    Call this when session or user changes.
+    This makes session_id and user_id show up in Langfuse traces; spans that
+    OpenLIT records during the turn become children of this one. Does nothing
+    when observability is not enabled.
     
     Args:
         session_id: Session identifier
         user_id: User identifier
         tags: Optional tags (joined as comma-separated string)
     """
-    tags_str = ",".join(tags) if tags else "local-assistant,streamlit,agno"
+    if not enabled:
+        yield None
+        return
     
-    # Set OTEL resource attributes - these get sent with every trace
-    os.environ["OTEL_RESOURCE_ATTRIBUTES"] = (
-        f"session.id={session_id},"
-        f"user.id={user_id},"
-        f"deployment.environment.name=development,"
-        f"service.name=local-assistant,"
-        f"service.tags={tags_str}"
-    )
+    from opentelemetry import trace
+    attributes = _build_span_attributes(session_id, user_id, tuple(tags) if tags else None)
+    with trace.get_tracer("local-assistant").start_as_current_span("agent-turn", attributes=attributes) as span:
+        yield span
+
+
+@functools.lru_cache(maxsize=256)
+def _build_span_attributes(session_id: str, user_id: str, tags: Optional[tuple]) -> Dict[str, str]:
+    """Span attributes for one session/user/tags combination (shared, don't mutate)"""
+    tags_str = ",".join(tags) if tags else _DEFAULT_TAGS_STR
+    return {
+        "session.id": session_id,
+        "user.id": user_id,
+        "service.tags": tags_str
+    }
 
 
 def is_observability_enabled() -> bool:
-    """Check if observability has been successfully initialized"""
-    return _observability_initialized
+    """Check if observability has been successfully initialized (same as reading `enabled`)"""
+    return enabled
 
 
+@functools.lru_cache(maxsize=1024)
 def calculate_cost(input_tokens: int, output_tokens: int) -> float:
     """
     Calculate cost for Gemini 2.5 Flash.
@@ -116,76 +261,7 @@ def calculate_cost(input_tokens: int, output_tokens: int) -> float:
     Returns:
         Total cost in USD
     """
-    input_cost = (input_tokens / 1_000_000) * 0.30
-    output_cost = (output_tokens / 1_000_000) * 2.50
-    return input_cost + output_cost
-
-    """
-    Setup Langfuse observability with SDK direct integration.
-    
-    Uses Langfuse SDK for proper session/user tracking.
-    
-    Returns:
-        bool: True if setup successful, False otherwise
-    """
-    global _observability_initialized, _langfuse_client
-    
-    if _observability_initialized:
-        return True
-    
-    try:
-        # Get credentials
-        public_key = os.getenv('LANGFUSE_PUBLIC_KEY')
-        secret_key = os.getenv('LANGFUSE_SECRET_KEY')
-        host = os.getenv('LANGFUSE_BASE_URL', 'https://cloud.langfuse.com')
-        
-        if not public_key or not secret_key:
-            print("⚠️  Langfuse credentials not configured")
-            return False
-        
-        # Initialize Langfuse SDK (for session/user tracking)
-        from langfuse import Langfuse
-        _langfuse_client = Langfuse(
-            public_key=public_key,
-            secret_key=secret_key,
-            host=host
-        )
-        
-        # Also initialize OpenLIT for auto-instrumentation
-        try:
-            import openlit
-            
-            # Build Basic Auth header
-            auth_header = base64.b64encode(
-                f"{public_key}:{secret_key}".encode()
-            ).decode()
-            
-            # Configure OTEL
-            os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = f"{host}/api/public/otel"
-            os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"Authorization=Basic {auth_header}"
-            
-            # Initialize OpenLIT (without disabled param - not supported)
-            openlit.init(
-                environment="development",
-                application_name="local-assistant"
-            )
-        except Exception as e:
-            print(f"⚠️  OpenLIT init warning: {e} (continuing with Langfuse SDK)")
-        
-        _observability_initialized = True
-        
-        print(f"✅ Langfuse observability enabled")
-        print(f"   Host: {host}")
-        print(f"   SDK: Direct integration")
-        
-        return True
-        
-    except ImportError as e:
-        print(f"⚠️  Langfuse SDK not available: {e}")
-        return False
-    except Exception as e:
-        print(f"⚠️  Failed to setup observability: {e}")
-        return False
+    return input_tokens * _IN_RATE + output_tokens * _OUT_RATE
 
 
 def get_langfuse_client():
@@ -213,66 +289,21 @@ def create_trace_context(
     Returns:
         Langfuse trace object or None
     """
-    if not _langfuse_client:
+    if _trace_fn is None:
         return None
     
-    default_tags = ["local-assistant", "streamlit", "agno"]
-    if tags:
-        default_tags.extend(tags)
+    trace_tags = list(_DEFAULT_TAGS) + tags if tags else _DEFAULT_TAGS
     
     try:
-        # Langfuse SDK v2 API uses create_trace (not trace)
-        trace = _langfuse_client.trace(
+        # Langfuse SDK v2 API
+        trace = _trace_fn(
             name="agent-interaction",
             session_id=session_id,
             user_id=user_id,
-            tags=default_tags,
+            tags=trace_tags,
             metadata=metadata or {}
         )
         return trace
-    except AttributeError:
-        # Fallback: Try alternative API
-        try:
-            # Some versions use different method
-            trace_id = f"trace-{session_id}-{hash(user_id) % 10000}"
-            _langfuse_client.score(
-                trace_id=trace_id,
-                name="session",
-                session_id=session_id,
-                user_id=user_id,
-                metadata=metadata or {}
-            )
-            return {"id": trace_id, "session_id": session_id}
-        except Exception:
-            # If all else fails, just flush to ensure client is connected
-            _langfuse_client.flush()
-            return {"session_id": session_id, "user_id": user_id}
     except Exception as e:
-        print(f"Trace creation error: {e}")
+        logger.debug("Trace creation error: %s", e)
         return None
-
-
-def is_observability_enabled() -> bool:
-    """Check if observability has been successfully initialized"""
-    return _observability_initialized
-
-
-def calculate_cost(input_tokens: int, output_tokens: int) -> float:
-    """
-    Calculate cost for Gemini 2.5 Flash.
-    
-    Pricing (as of Dec 2024):
-    - Input: $0.30 per 1M tokens
-    - Output: $2.50 per 1M tokens
-    
-    Args:
-        input_tokens: Number of input tokens
-        output_tokens: Number of output tokens
-    
-    Returns:
-        Total cost in USD
-    """
-    input_cost = (input_tokens / 1_000_000) * 0.30
-    output_cost = (output_tokens / 1_000_000) * 2.50
-    return input_cost + output_cost
-